@@ -1,7 +1,112 @@
+import atexit
 import json
+import mmap
+import matplotlib
+matplotlib.use('Agg') # Headless: only PNGs are written, so skip loading any GUI backend
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+import numpy as np
 import os # Import os to handle file paths
 import argparse # Import argparse for command-line arguments
+import glob # Import glob to expand --batch patterns
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from functools import lru_cache
+
+try:
+    import orjson # Faster JSON parser, used when available
+    _loads = orjson.loads
+except ImportError:
+    def _loads(data):
+        # Fall back to the standard library parser, which does not accept memoryviews
+        return json.loads(bytes(data))
+
+try:
+    import ijson # Streaming parser for large files, used when available
+    _JSON_ERRORS = (json.JSONDecodeError, ijson.JSONError)
+except ImportError:
+    ijson = None
+    _JSON_ERRORS = (json.JSONDecodeError,)
+
+_MMAP_THRESHOLD = 64 * 1024 # Files smaller than this are cheaper to read than to map
+_STREAM_THRESHOLD = 16 * 1024 # Below this, ijson's per-token overhead outweighs a full parse
+_MISSING = object() # Returned by _read_json_key when the key is absent
+
+def _read_json(json_file_path):
+    """
+    Reads and parses a JSON file, memory-mapping it when it is large enough
+    for that to avoid copying the contents into a separate buffer.
+    """
+    with open(json_file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < _MMAP_THRESHOLD:
+            return _loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return _loads(view)
+
+def _should_stream(json_file_path):
+    return ijson is not None and os.path.getsize(json_file_path) >= _STREAM_THRESHOLD
+
+def _read_json_key(json_file_path, key):
+    """
+    Returns the value of a single top-level key of a JSON object, or _MISSING if it is absent.
+    Large files are streamed so the rest of the document is never built in memory.
+    """
+    if _should_stream(json_file_path):
+        with open(json_file_path, 'rb') as f:
+            return next(ijson.items(f, key), _MISSING)
+    data = _read_json(json_file_path)
+    if key not in data:
+        return _MISSING
+    return data[key]
+
+def _iter_json_items(json_file_path):
+    """
+    Yields the top-level (key, value) pairs of a JSON object, streaming large files.
+    """
+    if _should_stream(json_file_path):
+        with open(json_file_path, 'rb') as f:
+            yield from ijson.kvitems(f, '')
+    else:
+        yield from _read_json(json_file_path).items()
+
+# Connection and grid lines are straight segments, so aggressive simplification costs nothing visually
+plt.rcParams['path.simplify'] = True
+plt.rcParams['path.simplify_threshold'] = 1.0
+
+_LABEL_FONT = {'family': 'sans-serif', 'size': 10} # Shared by every node label
+
+_HEX_CACHE = {} # Router value string -> parsed integer, shared by every file in a run
+
+def _parse_hex(value):
+    """
+    Parses a router value as hexadecimal, like int(value, 16), raising the same errors.
+    Router values are short and heavily repeated, so results are remembered by string.
+    """
+    try:
+        return _HEX_CACHE[value]
+    except KeyError:
+        pass
+    int_value = int(value, 16)
+    if len(value) <= 4: # Only cache strings that fit a 15-bit router value to keep the table small
+        _HEX_CACHE[value] = int_value
+    return int_value
+
+_FIGURES = {} # Figures kept alive between diagrams, keyed by diagram kind
+
+def _get_figure(kind, figsize):
+    """
+    Returns a cleared figure with a single Axes for the given diagram kind.
+    The figure is created on first use and reused afterwards, which saves
+    building a new figure and canvas for every router file in a batch.
+    """
+    fig = _FIGURES.get(kind)
+    if fig is None:
+        fig = _FIGURES[kind] = plt.figure(figsize=figsize)
+    else:
+        fig.clf()
+    return fig, fig.add_subplot()
+
+atexit.register(plt.close, 'all')
 
 def read_and_extract_router_data(json_file_path):
     """
@@ -10,35 +115,28 @@ def read_and_extract_router_data(json_file_path):
     Args:
         json_file_path (str): The path to the JSON file.
     Returns:
-        dict: A dictionary representing the mappings {input_num: [output_num1, output_num2,...]}, or None on error.
+        numpy.ndarray: A 15x15 boolean adjacency matrix where mappings[i, j] is True when
+                       input i+1 is routed to output j+1, or None on error.
     """
     try:
-        with open(json_file_path, 'r') as f:
-            data = json.load(f)  # Load the entire JSON data
+        router_data = _read_json_key(json_file_path, 'Router')  # Get the 'Router' array
     except FileNotFoundError:
         print(f"Error: File not found. The file '{json_file_path}' does not exist.")
-        return  # Exit the function if the file is not found
-        return None
-    except json.JSONDecodeError as e:
+        return None  # Exit the function if the file is not found
+    except _JSON_ERRORS as e:
         print(f"Error: Invalid JSON. The file '{json_file_path}' is not valid JSON:\n{e}")
-        return  # Exit if the JSON is invalid
-        return None
+        return None  # Exit if the JSON is invalid
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-        return  # Exit for other errors
-        return None
+        return None  # Exit for other errors
 
     # Check if the 'Router' key exists in the data
-    if 'Router' not in data:
+    if router_data is _MISSING:
         print(f"Error: The JSON file does not contain a 'Router' key.")
-        return  # Exit if the key is not found
-        return None
-
-    router_data = data['Router']  # Get the 'Router' array
+        return None  # Exit if the key is not found
 
     if not isinstance(router_data, list):
         print(f"Error: 'Router' key does not contain a list.")
-        return
         return None
 
     # Extract the first 15 entries, handling cases where the array has fewer than 15
@@ -46,27 +144,31 @@ def read_and_extract_router_data(json_file_path):
 
     print("MIDI Input/Output Mappings (First 15):")
     print("-" * 40)
-    mappings = {} # Dictionary to store the mappings for drawing
+    values = np.zeros(15, dtype='<u2') # Raw router values, one little-endian 16-bit word per input
+    parsed = np.zeros(15, dtype=bool) # Which inputs had a usable value
 
     for i, value in enumerate(first_15_router_entries):
-        input_num = i + 1
         try:
             # Convert the value from the JSON (which might be a string) to an integer
-            int_value = int(value, 16) # Specify base 16 for hexadecimal conversion
+            # Only bits 0 to 14 (outputs 1 to 15) are meaningful, so mask the rest off
+            values[i] = _parse_hex(value) & 0x7FFF # Parse as base 16 (hexadecimal)
+            parsed[i] = True
         except (ValueError, TypeError):
-            print(f"Warning: Input {input_num} has non-integer value '{value}'. Skipping.")
-            continue # Skip to the next input if conversion fails
+            print(f"Warning: Input {i + 1} has non-integer value '{value}'. Skipping.")
+
+    if not parsed.any():
+        return None
 
-        connected_outputs = []
-        for j in range(15):  # Check bits 0 to 14 for outputs 1 to 15
-            if (int_value >> j) & 1: # Use the integer value for the bitwise operation
-                output_num = j + 1
-                connected_outputs.append(output_num) # Store output number
+    # Unpack all bits at once: mappings[i, j] is True when input i+1 is routed to output j+1.
+    # Viewing the words as bytes and unpacking least-significant bit first yields bits 0-15
+    # of each input in order; bit 15 is not an output and is dropped.
+    bits = np.unpackbits(values.view(np.uint8), bitorder='little').reshape(15, 16)
+    mappings = bits[:, :15].astype(bool)
 
-        mappings[input_num] = connected_outputs # Store in the dictionary
+    for input_index in np.flatnonzero(parsed):
         # Print the textual representation
-        output_str_list = [f"Output {o}" for o in connected_outputs]
-        print(f"Input {input_num:2d} -> {', '.join(output_str_list) if output_str_list else 'None'}")
+        output_str_list = [f"Output {o + 1}" for o in np.flatnonzero(mappings[input_index])]
+        print(f"Input {input_index + 1:2d} -> {', '.join(output_str_list) if output_str_list else 'None'}")
 
     return mappings
 
@@ -86,10 +188,28 @@ def load_midi_names(names_json_path):
                - list: A list of integers representing the desired node order, or None if not found/invalid.
               or an empty dictionary if loading fails.
     """
+    try:
+        mtime = os.path.getmtime(names_json_path)
+    except OSError:
+        mtime = None # Let the loader report the missing file
+    # Keying on the modification time means an edited names file is picked up again
+    return _load_midi_names_cached(names_json_path, mtime)
+
+@lru_cache(maxsize=16)
+def _load_midi_names_cached(names_json_path, mtime):
+    """
+    Does the actual work for load_midi_names. Results are cached per (path, mtime)
+    so rendering many router files does not re-parse the same names file.
+    """
     names = {}
     try:
-        with open(names_json_path, 'r') as f:
-            raw_names = json.load(f)
+        raw_names = {}
+        wanted_keys = {str(n) for n in range(1, 16)} | {"Order"}
+        for key, value in _iter_json_items(names_json_path):
+            raw_names[key] = value
+            wanted_keys.discard(key)
+            if not wanted_keys: # Every name and the order have been seen; skip the rest
+                break
         order_list = None
         # Convert string keys to integers and store
         for key, name in raw_names.items():
@@ -117,7 +237,6 @@ def load_midi_names(names_json_path):
         return {}, None # Return empty names and no order
     except Exception as e:
         print(f"Warning: An unexpected error occurred loading names from '{names_json_path}': {e}. Using default labels.")
-        return names
         return names, None # Return potentially partial names, no order
     return names, order_list
 
@@ -126,18 +245,18 @@ def draw_mapping_diagram(mappings, midi_names, order_list, output_image_path, ro
     Draws a diagram of the mappings using Matplotlib and saves it to a file.
 
     Args:
-        mappings (dict): The mapping dictionary {input_num: [output_num1, ...]}.
+        mappings (numpy.ndarray): The 15x15 boolean adjacency matrix from read_and_extract_router_data.
         midi_names (dict): Dictionary mapping port numbers to names {1: "Name1", ...}.
         router_filename (str): The base name of the router JSON file for the title.
         order_list (list | None): Optional list defining the vertical order of nodes.
         output_image_path (str): The path to save the output image file (e.g., PNG).
     """
-    if not mappings:
+    if mappings is None:
         print("No mappings provided to draw.")
         return
 
     num_nodes = 15
-    fig, ax = plt.subplots(figsize=(10, 12)) # Increased size slightly for potentially longer names
+    fig, ax = _get_figure('diagram', figsize=(10, 12)) # Increased size slightly for potentially longer names
 
     # Node positions
     input_x = 0
@@ -145,63 +264,55 @@ def draw_mapping_diagram(mappings, midi_names, order_list, output_image_path, ro
     num_slots = num_nodes # Use 15 vertical slots
     y_spacing = 1.0 / (num_slots + 1)
 
-    # Determine vertical position index for each node
-    node_to_y_index = {}
-    ordered_nodes_set = set()
-    current_y_index = 0
-
-    if order_list:
-        for node_num in order_list:
-            if 1 <= node_num <= num_nodes and node_num not in node_to_y_index: # Ensure valid and not already placed
-                node_to_y_index[node_num] = current_y_index
-                ordered_nodes_set.add(node_num)
-                current_y_index += 1
-
-    # Place remaining nodes
-    all_nodes_set = set(range(1, num_nodes + 1))
-    remaining_nodes = sorted(list(all_nodes_set - ordered_nodes_set))
-
-    for node_num in remaining_nodes:
-        if node_num not in node_to_y_index: # Should always be true here, but safe check
-             node_to_y_index[node_num] = current_y_index
-             current_y_index += 1
-    # Draw nodes and labels
+    # Determine vertical position index for each node:
+    # valid nodes from order_list first (duplicates dropped), then the rest in numeric order
+    placed_nodes = list(dict.fromkeys(n for n in (order_list or []) if 1 <= n <= num_nodes))
+    placed_set = set(placed_nodes)
+    remaining_nodes = [n for n in range(1, num_nodes + 1) if n not in placed_set]
+    node_to_y_index = {node_num: y_index for y_index, node_num in enumerate(placed_nodes + remaining_nodes)}
+
+    # Precompute the y-coordinate of every node once, indexed by node number (slot 0 unused)
+    y_of_node = np.empty(num_nodes + 1)
+    for node_num, y_index in node_to_y_index.items():
+        y_of_node[node_num] = 1.0 - (y_index + 1) * y_spacing
+
+    # Draw all nodes at once: blue circles for inputs, red squares for outputs
+    node_ys = y_of_node[1:]
+    ax.scatter(np.full(num_nodes, input_x), node_ys, c='blue', marker='o', s=100, zorder=2)
+    ax.scatter(np.full(num_nodes, output_x), node_ys, c='red', marker='s', s=100, zorder=2)
+
+    # Look up every node's name once, indexed by node number (slot 0 unused).
+    # Each is None if not found or an empty string if present but blank.
+    labels = [None] + [midi_names.get(n) for n in range(1, num_nodes + 1)]
+
+    # Draw labels
     for node_num in range(1, num_nodes + 1):
-        y_index = node_to_y_index.get(node_num, -1) # Get the calculated vertical index
-        if y_index == -1: continue # Should not happen with current logic, but safety check
-
-        y = 1.0 - (y_index + 1) * y_spacing # Calculate y-coordinate based on index
-        # Get name or use default, handle empty strings
-        # Get name from dictionary. Will be None if not found or empty string if present but blank.
-        node_label = midi_names.get(node_num)
-        # Input node
-        ax.plot(input_x, y, 'bo', markersize=10) # Blue circle for input
-
-       # Only draw label text if the name exists and is not empty
-        if node_label: # Checks if name is not None and not an empty string
-            ax.text(input_x - 0.05, y, node_label, ha='right', va='center')
-        # Output node
-        ax.plot(output_x, y, 'rs', markersize=10) # Red square for output
+        y = y_of_node[node_num] # Look up the precomputed y-coordinate
+        node_label = labels[node_num]
         # Only draw label text if the name exists and is not empty
-        if node_label: # Checks if name is not None and not an empty string
-            ax.text(output_x + 0.05, y, node_label, ha='left', va='center')
+        if not node_label: # Checks if name is None or an empty string
+            continue
+        ax.text(input_x - 0.05, y, node_label, ha='right', va='center', fontdict=_LABEL_FONT) # Input label
+        ax.text(output_x + 0.05, y, node_label, ha='left', va='center', fontdict=_LABEL_FONT) # Output label
 
     # Draw connections
-    for input_num, output_nums in mappings.items():
-        input_y_index = node_to_y_index.get(input_num, -1)
-        input_name = midi_names.get(input_num) # Get input name
-        if input_y_index == -1: continue # Skip if input node wasn't placed
-        input_y = 1.0 - (input_y_index + 1) * y_spacing
-        input_name = midi_names.get(input_num) # Get input name
-        for output_num in output_nums:
-            output_y_index = node_to_y_index.get(output_num, -1)
-            output_name = midi_names.get(output_num) # Get output name
-            if output_y_index == -1: continue # Skip if output node wasn't placed
-            output_y = 1.0 - (output_y_index + 1) * y_spacing
-
-            # Only draw the line if BOTH input and output have a non-empty name
-            if input_name and output_name: # Checks if names are not None and not empty strings
-                ax.plot([input_x, output_x], [input_y, output_y], 'k-', alpha=0.6) # Black line
+    # Only draw a line if BOTH input and output have a non-empty name
+    has_name = np.array([bool(label) for label in labels])
+    input_nums, output_nums = np.nonzero(mappings)
+    input_nums += 1
+    output_nums += 1
+    keep = has_name[input_nums] & has_name[output_nums]
+    input_nums, output_nums = input_nums[keep], output_nums[keep]
+
+    # One (start, end) point pair per line, so they can be drawn as a single artist
+    segments = np.empty((len(input_nums), 2, 2))
+    segments[:, 0, 0] = input_x
+    segments[:, 0, 1] = y_of_node[input_nums]
+    segments[:, 1, 0] = output_x
+    segments[:, 1, 1] = y_of_node[output_nums]
+
+    # Black lines, drawn above the node markers like individual plot() lines would be
+    ax.add_collection(LineCollection(segments, colors='k', alpha=0.6, zorder=2))
 
     # Customize plot
     ax.set_xlim(-0.3, 1.3)
@@ -211,7 +322,7 @@ def draw_mapping_diagram(mappings, midi_names, order_list, output_image_path, ro
 
     # Save the figure
     try:
-        plt.savefig(output_image_path, bbox_inches='tight')
+        fig.savefig(output_image_path, bbox_inches='tight')
         print(f"\nDiagram saved successfully to: {output_image_path}")
     except Exception as e:
         print(f"\nError saving diagram to {output_image_path}: {e}")
@@ -219,20 +330,18 @@ def draw_mapping_diagram(mappings, midi_names, order_list, output_image_path, ro
     # Add title at the bottom using figure coordinates (relative to the whole figure)
     fig.text(0.5, 0.01, f'MIDI Mappings: {router_filename}', ha='center', va='bottom', fontsize=plt.rcParams['axes.titlesize'])
 
-    plt.close(fig) # Close the plot figure to free memory
-
 def draw_mapping_matrix(mappings, midi_names, order_list, output_image_path, router_filename):
     """
     Draws a matrix diagram of the mappings using Matplotlib and saves it to a file.
 
     Args:
-        mappings (dict): The mapping dictionary {input_num: [output_num1, ...]}.
+        mappings (numpy.ndarray): The 15x15 boolean adjacency matrix from read_and_extract_router_data.
         midi_names (dict): Dictionary mapping port numbers to names {1: "Name1", ...}.
         router_filename (str): The base name of the router JSON file for the title.
         order_list (list | None): Optional list defining the order for axes.
         output_image_path (str): The path to save the output image file (e.g., PNG).
     """
-    if not mappings:
+    if mappings is None:
         print("No mappings provided to draw matrix.")
         return
 
@@ -249,30 +358,26 @@ def draw_mapping_matrix(mappings, midi_names, order_list, output_image_path, rou
         print("Error: The 'Order' list is empty. Cannot draw matrix.")
         return
 
-    fig, ax = plt.subplots(figsize=(4, 4)) # Square figure often works well for matrices
-
     # --- Determine axis positions based *only* on the order_list ---
-    # Maps node number (from order_list) to display index (0 to num_displayed_nodes-1)
-    node_to_display_index = {node_num: index for index, node_num in enumerate(display_nodes_ordered)}
+    # Matrix row/column index of each displayed node, in display order
+    display_matrix_index = np.array(display_nodes_ordered) - 1
+
+    # --- Find the connection points ---
+    # Reorder the adjacency matrix into display order; row = input, column = output
+    display_mappings = mappings[np.ix_(display_matrix_index, display_matrix_index)]
+    # We plot at the *display index* coordinates
+    x_coords, y_coords = np.nonzero(display_mappings)
+
+    # Nothing to plot, so skip the figure, tick and label setup entirely
+    if len(x_coords) == 0:
+        print("No connections in ordered set; skipping matrix.")
+        return
+
+    fig, ax = _get_figure('matrix', figsize=(4, 4)) # Square figure often works well for matrices
 
     # Create lists of labels in the correct display order
     ordered_labels = [midi_names.get(node_num, f"Node {node_num}") for node_num in display_nodes_ordered] # Use default if name missing
 
-    # --- Plot the connection points ---
-    x_coords = []
-    y_coords = []
-    for input_num, output_nums in mappings.items():
-        # Check if the input node is in our ordered list
-        input_index = node_to_display_index.get(input_num)
-        if input_index is not None: # If input_num is in the order list...
-            for output_num in output_nums:
-                # Check if the output node is also in our ordered list
-                output_index = node_to_display_index.get(output_num)
-                if output_index is not None: # If output_num is in the order list...
-                    # We plot at the *display index* coordinates
-                    x_coords.append(input_index)
-                    y_coords.append(output_index)
-
     # Use scatter for individual points, easier than managing a full matrix image
     ax.scatter(x_coords, y_coords, marker='s', s=100, c='black', zorder=3) # Black squares
 
@@ -305,40 +410,29 @@ def draw_mapping_matrix(mappings, midi_names, order_list, output_image_path, rou
 
     # --- Save the figure ---
     try:
-        plt.savefig(output_image_path, bbox_inches='tight')
+        fig.savefig(output_image_path, bbox_inches='tight')
         print(f"\nMatrix diagram saved successfully to: {output_image_path}")
     except Exception as e:
         print(f"\nError saving matrix diagram to {output_image_path}: {e}")
 
+def _process_one(router_json_path, names_json_path, output_path=None):
+    """
+    Reads one router JSON file and saves its line and matrix diagrams.
 
-    plt.close(fig) # Close the plot figure
-
-if __name__ == "__main__":
-    # --- Command Line Argument Parsing ---
-    parser = argparse.ArgumentParser(description="Generate a mapping diagram from a MIDI router JSON file.")
-    parser.add_argument("router_json_path", help="Path to the input router JSON file.")
-    parser.add_argument("-n", "--names", help="Path to the MIDI names JSON file (defaults to 'y:\\Projects\\HxMIDI\\MIDI-Names.json').")
-    parser.add_argument("-o", "--output", help="Path to save the output diagram image (e.g., mappings.png). If omitted, defaults to a path based on the input filename.")
-
-    args = parser.parse_args()
-    router_json_path = args.router_json_path
+    Args:
+        router_json_path (str): The path to the router JSON file.
+        names_json_path (str): The path to the MIDI names JSON file.
+        output_path (str | None): Base path for the output images, or None to save them next to the router file.
+    """
     router_filename = os.path.splitext(os.path.basename(router_json_path))[0] # Get filename without extension
-    # --- End Argument Parsing ---
 
     mappings = read_and_extract_router_data(router_json_path)
 
-    if mappings:
-        # Define the path to the names file (using the provided absolute path)
-        # Use the path from command line if provided, otherwise use the default
-        if args.names:
-            names_json_path = args.names
-        else:
-            names_json_path = r"y:\Projects\HxMIDI\MIDI-Names.json" # Default path
-
+    if mappings is not None:
         midi_names, order_list = load_midi_names(names_json_path) # Unpack names and order
 
         # Suggest an output filename based on the input filename
-        base_output_path = args.output # Get base path from args if provided
+        base_output_path = output_path # Get base path from args if provided
         if not base_output_path:
             # If -o not used, create default base path without extension
             base_name = os.path.splitext(os.path.basename(router_json_path))[0]
@@ -365,3 +459,36 @@ if __name__ == "__main__":
         # --- Generate Matrix Diagram ---
         print(f"Attempting to save matrix diagram to: {matrix_output_path}")
         draw_mapping_matrix(mappings, midi_names, order_list, matrix_output_path, router_filename)
+
+if __name__ == "__main__":
+    # --- Command Line Argument Parsing ---
+    parser = argparse.ArgumentParser(description="Generate a mapping diagram from a MIDI router JSON file.")
+    parser.add_argument("router_json_path", nargs="?", help="Path to the input router JSON file.")
+    parser.add_argument("-n", "--names", help="Path to the MIDI names JSON file (defaults to 'y:\\Projects\\HxMIDI\\MIDI-Names.json').")
+    parser.add_argument("-o", "--output", help="Path to save the output diagram image (e.g., mappings.png). If omitted, defaults to a path based on the input filename.")
+    parser.add_argument("-b", "--batch", metavar="GLOB", help="Glob pattern of router JSON files to process in parallel (e.g., 'presets/*.json'). Images are saved next to each file.")
+
+    args = parser.parse_args()
+    if args.batch:
+        if args.router_json_path or args.output:
+            parser.error("--batch cannot be combined with a router file path or --output.")
+    elif not args.router_json_path:
+        parser.error("a router JSON file path is required unless --batch is used.")
+
+    # Use the path from command line if provided, otherwise use the default
+    if args.names:
+        names_json_path = args.names
+    else:
+        names_json_path = r"y:\Projects\HxMIDI\MIDI-Names.json" # Default path
+    # --- End Argument Parsing ---
+
+    if args.batch:
+        router_json_paths = sorted(glob.glob(args.batch))
+        if not router_json_paths:
+            print(f"Error: No files match '{args.batch}'.")
+        else:
+            # Each worker process keeps its own figures and names cache across the files it handles
+            with ProcessPoolExecutor() as executor:
+                list(executor.map(_process_one, router_json_paths, repeat(names_json_path)))
+    else:
+        _process_one(args.router_json_path, names_json_path, args.output)